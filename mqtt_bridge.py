@@ -2,11 +2,32 @@
 import paho.mqtt.client as mqtt
 import time
 import json
+import atexit
+import bisect
+import collections
 import os
-import glob
+import queue
 import logging
 import logging.handlers
+import random
+import re
+import socket
+import sys
 import threading
+import typing
+from dataclasses import dataclass
+
+# orjson is optional; both it and the stdlib parser accept bytes directly
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+# msgspec is optional; when present, status payloads decode only the keys we compare
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
 
 # Default configuration
 DEFAULT_CONFIG = {
@@ -14,6 +35,7 @@ DEFAULT_CONFIG = {
     'PORT': '1883',
     'MQTT_USER': 'mqtt',
     'MQTT_PASS': 'mqtt',
+    'CLIENT_ID': 'mqtt_bridge',
     'CONFIG_DIR': './library',
     'RECONNECT_DELAY': '5',
     'LOG_FILE': './mqtt_bridge.log',
@@ -24,22 +46,46 @@ DEFAULT_CONFIG = {
 
 CONFIG_FILE = 'mqtt_bridge.conf'
 
+# One library line: seven whitespace-separated fields, the last one taking the rest of the line
+LIBRARY_LINE_RE = re.compile(
+    r'^[ \t]*([^\s#]\S*)[ \t]+(\S+)[ \t]+(\S+)[ \t]+(\S+)[ \t]+(\S+)[ \t]+(\S+)[ \t]+(\S.*?)[ \t\r]*$',
+    re.M
+)
+
+# Seconds to wait for a device status response before dropping a pending command
+PENDING_TIMEOUT = 30
+
+@dataclass(frozen=True, slots=True)
+class BridgeConfig:
+    """Typed, read-only view of mqtt_bridge.conf"""
+    broker: str
+    port: int
+    mqtt_user: str
+    mqtt_pass: str
+    client_id: str
+    config_dir: str
+    reconnect_delay: int
+    log_file: str
+    log_max_size: int
+    log_backup_count: int
+    log_level: int
+
 def load_config():
     """Load configuration from file"""
-    config = DEFAULT_CONFIG.copy()
+    values = DEFAULT_CONFIG.copy()
     
     if os.path.exists(CONFIG_FILE):
         try:
-            with open(CONFIG_FILE, 'r') as f:
+            # Flat KEY = value lines; section headers such as [DEFAULT] and comments are skipped
+            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
                 for line in f:
                     line = line.strip()
-                    if line and not line.startswith('#') and '=' in line:
-                        key, value = line.split('=', 1)
-                        key = key.strip()
-                        value = value.strip()
-                        
-                        if key in DEFAULT_CONFIG:
-                            config[key] = value
+                    if not line or line[0] in '#;[':
+                        continue
+                    key, sep, value = line.partition('=')
+                    key = key.strip()
+                    if sep and key in DEFAULT_CONFIG:
+                        values[key] = value.strip()
             logging.info(f"Loaded configuration from {CONFIG_FILE}")
         except Exception as e:
             logging.error(f"Failed to read config file: {e}")
@@ -47,37 +93,42 @@ def load_config():
         logging.warning(f"Config file {CONFIG_FILE} not found, using defaults")
         try:
             with open(CONFIG_FILE, 'w') as f:
+                f.write("[DEFAULT]\n")
                 for key, value in DEFAULT_CONFIG.items():
                     f.write(f"{key} = {value}\n")
             logging.info(f"Created configuration file: {CONFIG_FILE}")
         except Exception as e:
             logging.error(f"Failed to create config file: {e}")
     
-    # Convert types
-    try:
-        config['PORT'] = int(config['PORT'])
-        config['RECONNECT_DELAY'] = int(config['RECONNECT_DELAY'])
-        config['LOG_MAX_SIZE'] = int(config['LOG_MAX_SIZE'])
-        config['LOG_BACKUP_COUNT'] = int(config['LOG_BACKUP_COUNT'])
-    except ValueError as e:
-        logging.error(f"Invalid config value: {e}")
-    
-    return config
+    # Convert types once, falling back to the default for values that don't parse
+    for key in ('PORT', 'RECONNECT_DELAY', 'LOG_MAX_SIZE', 'LOG_BACKUP_COUNT'):
+        try:
+            values[key] = int(values[key])
+        except ValueError as e:
+            logging.error(f"Invalid config value for {key}: {e}")
+            values[key] = int(DEFAULT_CONFIG[key])
+    
+    log_level = getattr(logging, values['LOG_LEVEL'].upper(), None)
+    values['LOG_LEVEL'] = log_level if isinstance(log_level, int) else logging.INFO
+    
+    return BridgeConfig(**{key.lower(): value for key, value in values.items()})
+
+log_listener = None
 
 def setup_logging(config):
-    """Setup logging with rotation"""
+    """Setup logging with rotation, writing from a background listener thread"""
+    global log_listener
+    
     try:
-        log_level = getattr(logging, config['LOG_LEVEL'].upper(), logging.INFO)
-        
         # Ensure log directory exists
-        log_dir = os.path.dirname(config['LOG_FILE'])
+        log_dir = os.path.dirname(config.log_file)
         if log_dir and not os.path.exists(log_dir):
             os.makedirs(log_dir)
         
         file_handler = logging.handlers.RotatingFileHandler(
-            filename=config['LOG_FILE'],
-            maxBytes=config['LOG_MAX_SIZE'],
-            backupCount=config['LOG_BACKUP_COUNT'],
+            filename=config.log_file,
+            maxBytes=config.log_max_size,
+            backupCount=config.log_backup_count,
             encoding='utf-8'
         )
         
@@ -88,142 +139,313 @@ def setup_logging(config):
         console_handler.setFormatter(formatter)
         
         # Clear existing handlers
-        logging.getLogger().handlers.clear()
+        root = logging.getLogger()
+        root.handlers.clear()
+        if log_listener:
+            log_listener.stop()
+        
+        # Callers only enqueue records; the listener thread does the file and console I/O.
+        # The queue handler gets no formatter so records are not formatted twice.
+        log_queue = queue.SimpleQueue()
+        log_listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler)
+        log_listener.start()
+        atexit.register(log_listener.stop)
         
         # Setup root logger
-        logging.basicConfig(
-            level=log_level,
-            handlers=[file_handler, console_handler],
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
+        root.setLevel(config.log_level)
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
         
     except Exception as e:
         print(f"Failed to setup logging: {e}")
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+status_decoders = {}
+
+def status_decoder(keys):
+    """Return a cached msgspec decoder for a JSON object holding the given keys"""
+    decoder = status_decoders.get(keys)
+    if decoder is None:
+        # Keys may not be valid identifiers, so fields are positional names renamed to the keys.
+        # A missing key decodes to None, matching dict.get() in the stdlib path.
+        names = [f"f{i}" for i in range(len(keys))]
+        status_type = msgspec.defstruct(
+            "ExpectedStatus",
+            [(name, typing.Any, None) for name in names],
+            rename=dict(zip(names, keys))
+        )
+        decoder = status_decoders[keys] = msgspec.json.Decoder(status_type)
+    return decoder
+
+def build_status_matcher(status_msg_bytes, expected_status_dict):
+    """Return a payload -> bool check specialised for one library status message"""
+    if expected_status_dict is None:
+        def matches(payload):
+            return status_msg_bytes in payload
+        return matches
+    
+    expected_items = tuple(expected_status_dict.items())
+    
+    if msgspec is not None:
+        decoder = status_decoder(tuple(key for key, _ in expected_items))
+        expected_values = tuple(value for _, value in expected_items)
+        
+        def matches(payload):
+            try:
+                status = decoder.decode(payload)
+            except msgspec.MsgspecError:
+                return status_msg_bytes in payload
+            return msgspec.structs.astuple(status) == expected_values
+        return matches
+    
+    # Most status messages carry a single key; compare it directly
+    if len(expected_items) == 1:
+        (key, value), = expected_items
+        
+        def matches(payload):
+            try:
+                return json_loads(payload).get(key) == value
+            except Exception:
+                return status_msg_bytes in payload
+    else:
+        def matches(payload):
+            try:
+                payload_json = json_loads(payload)
+                return all(payload_json.get(k) == v for k, v in expected_items)
+            except Exception:
+                return status_msg_bytes in payload
+    
+    return matches
+
+class Entry:
+    """A single library command (slotted to keep large libraries compact)"""
+    __slots__ = ('input_val', 'payload', 'cmd_topic', 'output', 'status_topic', 'status_msg', 'status_msg_bytes',
+                 'send_payload', 'expected_status_dict', 'matches', 'status_publish_topic')
+    
+    def __init__(self, input_val, payload, cmd_topic, output, status_topic, status_msg,
+                 send_payload, expected_status_dict, status_publish_topic):
+        self.input_val = input_val
+        self.payload = payload
+        self.cmd_topic = cmd_topic
+        self.output = output
+        self.status_topic = status_topic
+        self.status_msg = status_msg
+        self.status_msg_bytes = status_msg.encode()
+        self.send_payload = send_payload
+        self.expected_status_dict = expected_status_dict
+        self.matches = build_status_matcher(self.status_msg_bytes, expected_status_dict)
+        self.status_publish_topic = status_publish_topic
+
+class Pending:
+    """A command sent to a device that is awaiting its status response"""
+    __slots__ = ('ui_topic', 'input_val', 'output_val', 'timestamp', 'entry')
+    
+    def __init__(self, ui_topic, input_val, output_val, timestamp, entry):
+        self.ui_topic = ui_topic
+        self.input_val = input_val
+        self.output_val = output_val
+        self.timestamp = timestamp
+        self.entry = entry
+
 # Global variables
-IR_LIBRARY = {}
+root_logger = logging.getLogger()
+IR_ENTRIES = {}
+IR_TOPICS = set()
+STATUS_INDEX = {}
+STATUS_TOPICS = set()
+SUBSCRIPTIONS = []
+subscribed = False
 mqtt_client = None
-is_connected = False
-startup_time = None
 config = None
-pending_commands = {}
+# Ordered oldest-first so expiry only has to look at the head
+pending_commands = collections.OrderedDict()
+pending_lock = threading.Lock()
+stop_event = threading.Event()
 
 def log_message(direction, topic, payload):
+    if not root_logger.isEnabledFor(logging.INFO):
+        return
     direction_symbol = "→" if direction == "out" else "←"
-    truncated_payload = payload[:100] + "..." if len(payload) > 100 else payload
-    logging.info(f"{direction_symbol} {topic} = {truncated_payload}")
+    # Truncate via the format string so no concatenated copy is built
+    if len(payload) > 100:
+        payload = payload[:100]
+        fmt = "%s %s = %s..."
+    else:
+        fmt = "%s %s = %s"
+    # Incoming payloads stay as bytes until we know they will be logged
+    if isinstance(payload, bytes):
+        payload = payload.decode('utf-8', 'replace')
+    root_logger.info(fmt, direction_symbol, topic, payload)
+
+def warn_unparsed_lines(data, start, end, file_paths, file_starts):
+    """Warn about non-blank, non-comment lines in data[start:end] that did not parse"""
+    pos = start
+    for line in data[start:end].split('\n'):
+        stripped = line.strip()
+        if stripped and stripped[0] != "#":
+            # Map the buffer offset back to the file and line it came from
+            index = bisect.bisect_right(file_starts, pos) - 1
+            line_num = data.count('\n', file_starts[index], pos) + 1
+            logging.warning(f"Parse error {file_paths[index]}:{line_num}: expected 7 fields - Line: {stripped}")
+        pos += len(line) + 1
 
 def load_library():
-    global IR_LIBRARY
+    global IR_ENTRIES, IR_TOPICS, STATUS_INDEX, STATUS_TOPICS, SUBSCRIPTIONS
     
-    IR_LIBRARY = {}
-    config_dir = config['CONFIG_DIR']
+    IR_ENTRIES = {}
+    IR_TOPICS = set()
+    STATUS_INDEX = {}
+    config_dir = config.config_dir
     
     if not os.path.exists(config_dir):
         logging.error(f"Config directory not found: {config_dir}")
         return False
     
-    file_count = 0
     command_count = 0
+    debug_on = root_logger.isEnabledFor(logging.DEBUG)
     
-    for file_path in glob.glob(os.path.join(config_dir, "*")):
-        if os.path.isdir(file_path) or os.path.basename(file_path).startswith('.'):
-            continue
-            
+    # scandir reports the entry type from readdir, avoiding a stat() per file
+    with os.scandir(config_dir) as it:
+        file_paths = [e.path for e in it if not e.name.startswith('.') and e.is_file()]
+    
+    # Read every library file up front and parse them as a single buffer.
+    # file_starts records where each file begins so errors can name it.
+    texts = []
+    loaded_paths = []
+    file_starts = []
+    offset = 0
+    for file_path in file_paths:
         try:
-            with open(file_path, 'r') as f:
-                for line_num, line in enumerate(f, 1):
-                    line = line.strip()
-                    if not line or line.startswith("#"):
-                        continue
-                    
-                    try:
-                        # Parse 7 fields from your library format
-                        # Format: ui_topic, payload, device_topic, input_message, device_result, device_status, output_message
-                        ui_topic, payload, device_topic, input_msg, device_result, device_status, output_msg = line.split(maxsplit=6)
-                        
-                        # Store in library - using ui_topic directly (e.g., "205_ac_power")
-                        if ui_topic not in IR_LIBRARY:
-                            IR_LIBRARY[ui_topic] = {}
-                        
-                        IR_LIBRARY[ui_topic][input_msg] = {
-                            "payload": payload,
-                            "cmd_topic": device_topic,
-                            "output": output_msg,
-                            "status_topic": device_status,
-                            "status_msg": device_result
-                        }
-                        
-                        command_count += 1
-                        logging.debug(f"Loaded: {ui_topic}[{input_msg}] → {output_msg}")
-                    except Exception as e:
-                        logging.warning(f"Parse error {file_path}:{line_num}: {e} - Line: {line}")
-            
-            file_count += 1
+            # Raw read plus one decode skips the text layer's incremental decoding
+            with open(file_path, 'rb') as f:
+                text = f.read().decode('utf-8', 'replace')
         except Exception as e:
             logging.error(f"File error {file_path}: {e}")
+            continue
+        
+        texts.append(text)
+        loaded_paths.append(file_path)
+        file_starts.append(offset)
+        offset += len(text) + 1
+    
+    file_count = len(texts)
+    data = '\n'.join(texts)
+    
+    pos = 0
+    for match in LIBRARY_LINE_RE.finditer(data):
+        if match.start() > pos:
+            warn_unparsed_lines(data, pos, match.start(), loaded_paths, file_starts)
+        pos = match.end()
+        
+        # Format: ui_topic, payload, device_topic, input_message, device_result, device_status, output_message
+        ui_topic, payload, device_topic, input_msg, device_result, device_status, output_msg = match.groups()
+        
+        # Topics and inputs repeat across the library; share one object each
+        ui_topic = sys.intern(ui_topic)
+        input_msg = sys.intern(input_msg)
+        device_topic = sys.intern(device_topic)
+        device_status = sys.intern(device_status)
+        
+        # Pre-serialize the IR payload (as bytes, which paho sends without re-encoding)
+        # and pre-parse the expected status once
+        try:
+            send_payload = json.dumps(json.loads(payload)).encode()
+        except Exception:
+            send_payload = payload.encode()
+        
+        try:
+            expected_status = json.loads(device_result)
+            if not isinstance(expected_status, dict):
+                expected_status = None
+        except Exception:
+            expected_status = None
+        
+        entry = Entry(
+            input_val=input_msg,
+            payload=payload,
+            cmd_topic=device_topic,
+            output=output_msg,
+            status_topic=device_status,
+            status_msg=device_result,
+            send_payload=send_payload,
+            expected_status_dict=expected_status,
+            status_publish_topic=ui_topic + "/status"
+        )
+        # Store in library keyed by (ui_topic, raw input bytes), e.g. ("205_ac_power", b"on"),
+        # so incoming payloads can be looked up without decoding them
+        IR_ENTRIES[(ui_topic, input_msg.encode())] = entry
+        IR_TOPICS.add(ui_topic)
+        
+        # Reverse index: device status topic → commands reporting on it
+        STATUS_INDEX.setdefault(device_status, []).append((ui_topic, input_msg, entry))
+        
+        command_count += 1
+        if debug_on:
+            logging.debug("Loaded: %s[%s] → %s", ui_topic, input_msg, output_msg)
+    
+    if pos < len(data):
+        warn_unparsed_lines(data, pos, len(data), loaded_paths, file_starts)
     
     if command_count == 0:
         logging.error(f"No valid commands found in {config_dir}")
         return False
     
-    logging.info(f"Loaded {command_count} commands from {file_count} files in {len(IR_LIBRARY)} topics")
+    STATUS_TOPICS = set(STATUS_INDEX)
+    SUBSCRIPTIONS = [(topic, 0) for topic in IR_TOPICS | STATUS_TOPICS]
+    
+    logging.info(f"Loaded {command_count} commands from {file_count} files in {len(IR_TOPICS)} topics")
     
     # Print loaded commands for debugging
-    logging.debug("Loaded commands:")
-    for topic, commands in IR_LIBRARY.items():
-        logging.debug(f"  {topic}: {list(commands.keys())}")
+    if debug_on:
+        logging.debug("Loaded commands:")
+        commands = {}
+        for (topic, _), entry in IR_ENTRIES.items():
+            commands.setdefault(topic, []).append(entry.input_val)
+        for topic, inputs in commands.items():
+            logging.debug("  %s: %s", topic, inputs)
     
     return True
 
-def reconnect():
-    global is_connected
-    
-    reconnect_delay = config['RECONNECT_DELAY']
-    
-    while True:
-        if not is_connected:
-            logging.info(f"Attempting to connect to {config['BROKER']}:{config['PORT']}")
-            try:
-                mqtt_client.reconnect()
-                time.sleep(reconnect_delay)
-            except Exception as e:
-                logging.error(f"Reconnect failed: {e}")
-                time.sleep(reconnect_delay)
-        else:
-            time.sleep(1)
+def session_present(flags):
+    """Return the CONNACK session-present flag from either paho callback API"""
+    # paho 2.x (VERSION2 callbacks) passes ConnectFlags, 1.x a dict
+    if isinstance(flags, dict):
+        return bool(flags.get('session present'))
+    return bool(getattr(flags, 'session_present', False))
 
-def on_connect(client, userdata, flags, rc):
-    global is_connected, startup_time
+def on_connect(client, userdata, flags, rc, properties=None):
+    global subscribed
     
     if rc == 0:
-        is_connected = True
-        startup_time = time.time()
-        logging.info(f"Connected to MQTT broker {config['BROKER']}:{config['PORT']} (code: {rc})")
-        
-        # Subscribe to all UI topics from library
-        for topic in IR_LIBRARY.keys():
-            client.subscribe(topic)
-            logging.debug(f"Subscribed to UI topic: {topic}")
+        logging.info(f"Connected to MQTT broker {config.broker}:{config.port} (code: {rc})")
         
-        # Subscribe to all device status topics
-        status_topics = set()
-        for commands in IR_LIBRARY.values():
-            for entry in commands.values():
-                status_topics.add(entry["status_topic"])
+        # Send small PUBLISH packets immediately instead of letting Nagle hold them back
+        try:
+            sock = client.socket()
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        except (AttributeError, OSError) as e:
+            logging.debug("Could not set socket options: %s", e)
         
-        for topic in status_topics:
-            client.subscribe(topic)
-            logging.debug(f"Subscribed to device status: {topic}")
+        # A resumed persistent session still holds the subscriptions we made earlier in
+        # this process. Always subscribe on the first connect, as the library may have changed.
+        if subscribed and session_present(flags):
+            logging.debug("Broker resumed session; keeping existing subscriptions")
+        # Subscribe to all UI and device status topics in a single SUBSCRIBE packet
+        elif SUBSCRIPTIONS:
+            client.subscribe(SUBSCRIPTIONS)
+            subscribed = True
+            if root_logger.isEnabledFor(logging.DEBUG):
+                logging.debug("Subscribed to UI topics: %s", sorted(IR_TOPICS))
+                logging.debug("Subscribed to device status: %s", sorted(STATUS_TOPICS))
     else:
-        is_connected = False
         logging.error(f"Connection failed (code: {rc})")
 
-def on_disconnect(client, userdata, rc):
-    global is_connected
-    is_connected = False
+def on_disconnect(client, userdata, flags_or_rc, rc=None, properties=None):
+    # paho 2.x (VERSION2 callbacks) passes disconnect flags before the reason code
+    if rc is None:
+        rc = flags_or_rc
     
+    # paho's network loop reconnects on its own with exponential backoff
     if rc != 0:
         logging.warning(f"Unexpected disconnect (code: {rc}). Reconnecting...")
     else:
@@ -232,107 +454,116 @@ def on_disconnect(client, userdata, rc):
 def on_message(client, userdata, msg):
     global pending_commands
     
-    # Ignore messages received during first 3 seconds after startup
-    if startup_time and (time.time() - startup_time) < 3:
-        logging.debug(f"Ignoring message on startup: {msg.topic}")
+    # Ignore retained messages replayed by the broker when we subscribe
+    if msg.retain:
+        logging.debug("Ignoring retained message: %s", msg.topic)
         return
     
-    topic = msg.topic
-    payload = msg.payload.decode()
+    topic = sys.intern(msg.topic)
+    is_ui = topic in IR_TOPICS
+    is_status = topic in STATUS_INDEX
+    
+    # Drop messages we will not act on before decoding or logging them
+    if not (is_ui or is_status):
+        return
+    
+    payload = msg.payload
     
     log_message("in", topic, payload)
     
     # Handle commands from UI topics
-    if topic in IR_LIBRARY:
+    if is_ui:
         input_val = payload.strip()
         
-        if input_val in IR_LIBRARY[topic]:
-            entry = IR_LIBRARY[topic][input_val]
-            
+        entry = IR_ENTRIES.get((topic, input_val))
+        if entry is not None:
             # Send IR command
-            try:
-                payload_json = json.loads(entry["payload"])
-                send_payload = json.dumps(payload_json)
-            except:
-                send_payload = entry["payload"]
-            
-            client.publish(entry["cmd_topic"], send_payload)
-            log_message("out", entry["cmd_topic"], send_payload)
+            send_payload = entry.send_payload
+            client.publish(entry.cmd_topic, send_payload)
+            log_message("out", entry.cmd_topic, send_payload)
             
             # Track this command as pending
-            pending_commands[entry["status_topic"]] = {
-                "ui_topic": topic,
-                "input_val": input_val,
-                "output_val": entry["output"],
-                "timestamp": time.time()
-            }
-            logging.debug(f"Tracked pending command: {entry['status_topic']} → {entry['output']}")
+            pending = Pending(
+                ui_topic=topic,
+                input_val=entry.input_val,
+                output_val=entry.output,
+                timestamp=time.monotonic(),
+                entry=entry
+            )
+            with pending_lock:
+                pending_commands[entry.status_topic] = pending
+                # A re-sent command replaces the old one and becomes the newest
+                pending_commands.move_to_end(entry.status_topic)
+            logging.debug("Tracked pending command: %s → %s", entry.status_topic, entry.output)
         else:
-            logging.warning(f"Unknown input '{input_val}' for topic '{topic}'")
+            logging.warning(f"Unknown input '{input_val.decode('utf-8', 'replace')}' for topic '{topic}'")
     
     # Handle status/responses from IR devices
     elif topic in pending_commands:
-        pending_data = pending_commands.pop(topic, None)
+        with pending_lock:
+            pending_data = pending_commands.pop(topic, None)
         if not pending_data:
             return
         
-        payload_str = payload
-        
         # Check if response matches expected status message
-        entry = IR_LIBRARY[pending_data["ui_topic"]][pending_data["input_val"]]
-        status_msg = entry["status_msg"]
+        entry = pending_data.entry
         
-        try:
-            expected_json = json.loads(status_msg)
-            payload_json = json.loads(payload_str)
-            
-            if all(payload_json.get(k) == v for k, v in expected_json.items()):
-                # Publish the CORRECT output based on the input that was sent
-                status_topic = f"{pending_data['ui_topic']}/status"
-                client.publish(status_topic, pending_data["output_val"], retain=True)
-                log_message("out", status_topic, pending_data["output_val"])
-        except:
-            if status_msg in payload_str:
-                status_topic = f"{pending_data['ui_topic']}/status"
-                client.publish(status_topic, pending_data["output_val"], retain=True)
-                log_message("out", status_topic, pending_data["output_val"])
+        if entry.matches(payload):
+            # Publish the CORRECT output based on the input that was sent
+            status_topic = entry.status_publish_topic
+            client.publish(status_topic, pending_data.output_val, retain=True)
+            log_message("out", status_topic, pending_data.output_val)
         
-        logging.debug(f"Cleared pending command for {topic}")
+        logging.debug("Cleared pending command for %s", topic)
 
 def initialize_mqtt():
     global mqtt_client
     
     try:
-        mqtt_client = mqtt.Client()
-    except:
-        mqtt_client = mqtt.Client()
+        mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=config.client_id, clean_session=False)
+    except AttributeError:
+        # paho-mqtt < 2.0 has no CallbackAPIVersion and only the VERSION1 callbacks
+        mqtt_client = mqtt.Client(client_id=config.client_id, clean_session=False)
     
-    mqtt_client.username_pw_set(config['MQTT_USER'], config['MQTT_PASS'])
+    mqtt_client.username_pw_set(config.mqtt_user, config.mqtt_pass)
     mqtt_client.on_connect = on_connect
     mqtt_client.on_disconnect = on_disconnect
     mqtt_client.on_message = on_message
     
-    mqtt_client.reconnect_delay_set(min_delay=1, max_delay=60)
-    
-    reconnect_thread = threading.Thread(target=reconnect, daemon=True)
-    reconnect_thread.start()
+    # Let loop_start() handle reconnects, doubling the delay after each failure.
+    # Jitter the ceiling per process so a fleet of bridges doesn't reconnect in lockstep.
+    min_delay = config.reconnect_delay
+    max_delay = max(min_delay, int(60 * random.uniform(0.9, 1.1)))
+    mqtt_client.reconnect_delay_set(min_delay=min_delay, max_delay=max_delay)
     
     return mqtt_client
 
 def cleanup_pending_commands():
-    """Clean up old pending commands"""
+    """Clean up old pending commands, returning seconds until the next one expires"""
     global pending_commands
     
-    current_time = time.time()
-    to_remove = []
+    current_time = time.monotonic()
+    
+    expired = []
+    with pending_lock:
+        # pending_commands is oldest-first, so only the expired head is visited
+        while pending_commands:
+            data = next(iter(pending_commands.values()))
+            if current_time - data.timestamp <= PENDING_TIMEOUT:
+                break
+            pending_commands.popitem(last=False)
+            expired.append(data)
+        
+        # Anything added from now on expires no sooner than a full timeout away
+        if pending_commands:
+            next_expiry = max(0, data.timestamp + PENDING_TIMEOUT - current_time)
+        else:
+            next_expiry = PENDING_TIMEOUT
     
-    for status_topic, data in pending_commands.items():
-        if current_time - data["timestamp"] > 30:
-            to_remove.append(status_topic)
-            logging.warning(f"Timeout for pending command: {data['ui_topic']} = {data['input_val']}")
+    for data in expired:
+        logging.warning(f"Timeout for pending command: {data.ui_topic} = {data.input_val}")
     
-    for topic in to_remove:
-        pending_commands.pop(topic, None)
+    return next_expiry
 
 def main():
     global config
@@ -346,7 +577,7 @@ def main():
         
         logging.info("=" * 60)
         logging.info("MQTT-IR Bridge Starting")
-        logging.info(f"Config directory: {config['CONFIG_DIR']}")
+        logging.info(f"Config directory: {config.config_dir}")
         logging.info("=" * 60)
         
         # Load library
@@ -357,19 +588,20 @@ def main():
         # Initialize MQTT
         client = initialize_mqtt()
         
-        # Connect
-        client.connect(config['BROKER'], config['PORT'], 60)
+        # Connect from the network thread so the first attempt gets the same backoff as reconnects
+        client.connect_async(config.broker, config.port, 60)
         client.loop_start()
         
         logging.info("Bridge started successfully")
-        logging.info(f"Listening on topics: {list(IR_LIBRARY.keys())}")
+        logging.info(f"Listening on topics: {sorted(IR_TOPICS)}")
         
-        # Main loop with periodic cleanup
-        while True:
-            time.sleep(1)
-            cleanup_pending_commands()
+        # Main loop: sleep until the oldest pending command is due to expire
+        next_expiry = PENDING_TIMEOUT
+        while not stop_event.wait(next_expiry):
+            next_expiry = cleanup_pending_commands()
             
     except KeyboardInterrupt:
+        stop_event.set()
         logging.info("Shutdown requested by user")
     except Exception as e:
         logging.error(f"Fatal error: {e}")